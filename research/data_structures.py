@@ -83,6 +83,9 @@ class UnionFind:
 class TreeMultiMap:
     """A tree-based multi-map."""
 
+    # slots keep the many small States and Actions in RL agents compact
+    __slots__ = ('_hash', 'root', 'size', '_multi_level')
+
     UNIQUE_KEY = 0
     UNIQUE_VALUE = 1
     MULTI_VALUE = 2
@@ -90,6 +93,8 @@ class TreeMultiMap:
     class Node:
         """A tree node."""
 
+        __slots__ = ('key', 'value', 'left', 'right', 'height', 'balance')
+
         def __init__(self, key, value):
             """Initialize the Node.
 
@@ -217,6 +222,7 @@ class TreeMultiMap:
                 constants of the TreeMultiMap class.
             **kwargs: Arbitrary keyword arguments.
         """
+        self._hash = None
         self.root = None
         self.size = 0
         if multi_level is None:
@@ -258,7 +264,10 @@ class TreeMultiMap:
         return True
 
     def __hash__(self):
-        return hash(tuple(self.items()))
+        # the hash is cached until the next modification
+        if self._hash is None:
+            self._hash = hash(tuple(self.items()))
+        return self._hash
 
     def __lt__(self, other):
         assert isinstance(other, TreeMultiMap)
@@ -331,6 +340,7 @@ class TreeMultiMap:
         """Remove all key and values."""
         self.root = None
         self.size = 0
+        self._hash = None
 
     def _balance(self, node):
         node.update_height_balance()
@@ -378,6 +388,7 @@ class TreeMultiMap:
         """
         self.root = self._add(key, value, self.root)
         self.size += 1
+        self._hash = None
 
     def _add(self, key, value, node):
         if node is None:
@@ -468,6 +479,7 @@ class TreeMultiMap:
         """
         self.root = self._remove(key, value, self.root)
         self.size -= 1
+        self._hash = None
 
     def _remove(self, key, value, node):
         if node is None:
@@ -176,7 +176,7 @@ class RDFSQLizer:
                 for sql in self._populate_namespaces():
                     out_fd.write(sql + '\n')
                 out_fd.write('\n')
-                for line in in_fd.readlines():
+                for line in in_fd:
                     sql = self._dispatch_nt_line(line.strip())
                     if sql is not None:
                         out_fd.write(sql + '\n')
@@ -1,6 +1,10 @@
 """Reinforcement learning agents."""
 
 from collections import defaultdict
+from random import Random
+
+import numpy as np
+from numba import njit
 
 from .randommixin import RandomMixin
 
@@ -8,6 +12,8 @@ from .randommixin import RandomMixin
 class Agent(RandomMixin):
     """A reinforcement learning agent."""
 
+    RANDOM_BUFFER_SIZE = 4096
+
     def __init__(self, *args, **kwargs):
         """Initialize the Agent.
 
@@ -18,8 +24,28 @@ class Agent(RandomMixin):
         super().__init__(*args, **kwargs)
         self.prev_observation = None
         self.prev_action = None
+        # NumPy random numbers, seeded separately to leave self.rng untouched
+        self._np_rng = np.random.default_rng(Random(self.random_seed).getrandbits(64))
+        self._random_buffer = []
+        self._random_index = 0
         self.start_new_episode()
 
+    def _random(self):
+        """Get a uniform random float in [0, 1).
+
+        Random numbers are drawn from NumPy in blocks to amortize the cost of
+        generating them over many steps.
+
+        Returns:
+            float: The random number.
+        """
+        if self._random_index == len(self._random_buffer):
+            self._random_buffer = self._np_rng.random(self.RANDOM_BUFFER_SIZE).tolist()
+            self._random_index = 0
+        result = self._random_buffer[self._random_index]
+        self._random_index += 1
+        return result
+
     def start_new_episode(self):
         """Prepare the agent for a new episode."""
         self.prev_observation = None
@@ -35,6 +61,13 @@ class Agent(RandomMixin):
         """
         raise NotImplementedError()
 
+    def observe_end_of_episode(self):
+        """Update the value function at the end of an episode.
+
+        This is called whether the episode ended naturally or was cut short.
+        By default, it does nothing.
+        """
+
     def get_value(self, observation, action):
         """Get the Q value for an action at an observation.
 
@@ -97,13 +130,7 @@ class Agent(RandomMixin):
         Returns:
             Action: The action the agent takes.
         """
-        best_action = None
-        best_value = None
-        for action in actions:
-            value = self.get_value(observation, action)
-            if value is not None and (best_value is None or value > best_value):
-                best_action = action
-                best_value = value
+        best_action = self.get_best_stored_action(observation, actions=actions)
         if best_action is None:
             best_action = self.rng.choice(actions)
         assert best_action is None or best_action in actions
@@ -131,51 +158,356 @@ class Agent(RandomMixin):
         raise NotImplementedError()
 
 
+@njit(cache=True)
+def td_update(
+        q_table, stored, best_values, best_actions,
+        state_id, action_id, next_state_id, reward,
+        learning_rate, discount_rate,
+):
+    """Perform a Q-learning update on a Q-table and its best action cache.
+
+    Arguments:
+        q_table (np.ndarray): The (states, actions) array of values.
+        stored (np.ndarray): The (states, actions) boolean array of stored values.
+        best_values (np.ndarray): The best stored value of each state.
+        best_actions (np.ndarray): The best stored action of each state, or -1.
+        state_id (int): The ID of the previous state.
+        action_id (int): The ID of the previous action.
+        next_state_id (int): The ID of the current state, or -1 if it is unknown.
+        reward (float): The reward from the previous action.
+        learning_rate (float): The learning rate (alpha).
+        discount_rate (float): The discount rate (gamma).
+    """
+    if next_state_id == -1 or best_actions[next_state_id] == -1:
+        next_value = 0.0
+    else:
+        next_value = best_values[next_state_id]
+    prev_value = q_table[state_id, action_id]
+    value = (1 - learning_rate) * prev_value + learning_rate * (reward + discount_rate * next_value)
+    q_table[state_id, action_id] = value
+    stored[state_id, action_id] = True
+    best_action = best_actions[state_id]
+    if best_action == -1 or value > best_values[state_id]:
+        best_actions[state_id] = action_id
+        best_values[state_id] = value
+    elif best_action == action_id:
+        # the best action got worse, so another action may now be better
+        best_value = -np.inf
+        for other_id in range(q_table.shape[1]):
+            if stored[state_id, other_id] and q_table[state_id, other_id] > best_value:
+                best_action = other_id
+                best_value = q_table[state_id, other_id]
+        best_actions[state_id] = best_action
+        best_values[state_id] = best_value
+
+
 class TabularQLearningAgent(Agent):
-    """A tabular Q-learning reinforcement learning agent."""
+    """A tabular Q-learning reinforcement learning agent.
+
+    The Q-table is a dense NumPy array indexed by integer IDs, which are
+    assigned to states and actions the first time they are seen. A boolean
+    mask records which entries have been stored, and the best stored action
+    and value of each state are cached so that the TD target is a single
+    array load.
+
+    In 'online' learn mode, the value function is updated after every step.
+    In 'batch' learn mode, transitions are buffered and the whole episode is
+    applied in one vectorized update (repeated replay_epochs times) when the
+    episode ends.
+    """
 
-    def __init__(self, learning_rate, discount_rate, *args, **kwargs):
+    INITIAL_CAPACITY = 16
+    LEARN_MODES = ('online', 'batch')
+
+    def __init__(self, learning_rate, discount_rate, *args, learn_mode='online', replay_epochs=1, **kwargs):
         """Initialize a tabular Q-learning agent.
 
         Arguments:
             learning_rate (float): The learning rate (alpha).
             discount_rate (float): The discount rate (gamma).
             *args: Arbitrary positional arguments.
+            learn_mode (str): Either 'online' or 'batch'. Defaults to 'online'.
+            replay_epochs (int): The number of times a batch episode is
+                replayed. Defaults to 1.
             **kwargs: Arbitrary keyword arguments.
+
+        Raises:
+            ValueError: If the learn mode is not recognized.
         """
+        if learn_mode not in self.LEARN_MODES:
+            raise ValueError('Unknown learn mode: {}'.format(learn_mode))
+        self.learn_mode = learn_mode
+        self.replay_epochs = replay_epochs
+        # buffered (state ID, action ID, reward, next observation) transitions
+        self._transitions = []
         super().__init__(*args, **kwargs)
-        self.value_function = defaultdict((lambda: defaultdict(float)))
         self.learning_rate = learning_rate
         self.discount_rate = discount_rate
+        # interning tables
+        self._state_ids = {}
+        self._action_ids = {}
+        self._states = []
+        self._actions = []
+        # value function
+        capacity = self.INITIAL_CAPACITY
+        self._q = np.zeros((capacity, capacity), dtype=np.float64)
+        self._stored = np.zeros((capacity, capacity), dtype=bool)
+        self._best_values = np.full(capacity, -np.inf, dtype=np.float64)
+        self._best_actions = np.full(capacity, -1, dtype=np.int32)
+
+    def _intern_state(self, state):
+        """Get the ID of a state, assigning one if necessary.
+
+        Arguments:
+            state (State): The state.
+
+        Returns:
+            int: The ID of the state.
+        """
+        state_id = self._state_ids.setdefault(state, len(self._state_ids))
+        if state_id == len(self._states):
+            self._states.append(state)
+            if state_id == self._q.shape[0]:
+                self._grow(2 * self._q.shape[0], self._q.shape[1])
+        return state_id
+
+    def _intern_action(self, action):
+        """Get the ID of an action, assigning one if necessary.
+
+        Arguments:
+            action (Action): The action.
+
+        Returns:
+            int: The ID of the action.
+        """
+        action_id = self._action_ids.setdefault(action, len(self._action_ids))
+        if action_id == len(self._actions):
+            self._actions.append(action)
+            if action_id == self._q.shape[1]:
+                self._grow(self._q.shape[0], 2 * self._q.shape[1])
+        return action_id
+
+    def _grow(self, num_states, num_actions):
+        """Enlarge the Q-table and its caches, preserving stored values.
+
+        Arguments:
+            num_states (int): The new state capacity.
+            num_actions (int): The new action capacity.
+        """
+        old_states, old_actions = self._q.shape
+        q_table = np.zeros((num_states, num_actions), dtype=np.float64)
+        q_table[:old_states, :old_actions] = self._q
+        self._q = q_table
+        stored = np.zeros((num_states, num_actions), dtype=bool)
+        stored[:old_states, :old_actions] = self._stored
+        self._stored = stored
+        if num_states != old_states:
+            self._best_values = np.concatenate([
+                self._best_values,
+                np.full(num_states - old_states, -np.inf, dtype=np.float64),
+            ])
+            self._best_actions = np.concatenate([
+                self._best_actions,
+                np.full(num_states - old_states, -1, dtype=np.int32),
+            ])
+
+    def get_table_arrays(self):
+        """Get the arrays that hold the value function.
+
+        The arrays are shared with the agent, so updating them in place (for
+        example with td_update()) updates the agent. They are replaced when
+        the table grows, so all states and actions should be interned first.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: The Q-table,
+                the stored mask, the best stored values, and the best stored
+                actions, as taken by td_update().
+        """
+        return self._q, self._stored, self._best_values, self._best_actions
+
+    def intern_states(self, states):
+        """Get the IDs of states, assigning them if necessary.
+
+        Arguments:
+            states (Sequence[State]): The states.
+
+        Returns:
+            np.ndarray: The ID of each state.
+        """
+        return np.array([self._intern_state(state) for state in states], dtype=np.int64)
+
+    def intern_actions(self, actions):
+        """Get the IDs of actions, assigning them if necessary.
+
+        Arguments:
+            actions (Sequence[Action]): The actions.
+
+        Returns:
+            np.ndarray: The ID of each action.
+        """
+        return np.array([self._intern_action(action) for action in actions], dtype=np.int64)
+
+    def batch_act(self, state_ids, action_ids, action_mask, exploration_rate=0):
+        """Decide on the next action for a batch of independent environments.
+
+        Arguments:
+            state_ids (np.ndarray): The ID of the observation of each environment.
+            action_ids (np.ndarray): The IDs of all possible actions.
+            action_mask (np.ndarray): A (len(state_ids), len(action_ids))
+                boolean array of the available actions in each environment.
+            exploration_rate (float): The probability of a random action.
+                Defaults to 0.
+
+        Returns:
+            np.ndarray: The chosen action of each environment, as an index
+                into action_ids.
+        """
+        values = np.where(action_mask, self._q[np.ix_(state_ids, action_ids)], -np.inf)
+        choices = values.argmax(axis=1)
+        if exploration_rate > 0:
+            explore = self._np_rng.random(len(state_ids)) < exploration_rate
+            random_choices = np.where(
+                action_mask,
+                self._np_rng.random(action_mask.shape),
+                -1,
+            ).argmax(axis=1)
+            choices = np.where(explore, random_choices, choices)
+        return choices
+
+    def batch_observe_reward(self, prev_state_ids, prev_action_ids, rewards, state_ids):
+        """Update the value function with the rewards from a batch of environments.
+
+        If the same state-action pair appears more than once in the batch,
+        only one of the updates takes effect.
+
+        Arguments:
+            prev_state_ids (np.ndarray): The ID of the previous observation of each environment.
+            prev_action_ids (np.ndarray): The ID of the previous action of each environment.
+            rewards (np.ndarray): The reward from the previous action of each environment.
+            state_ids (np.ndarray): The ID of the current observation of each environment,
+                or -1 if it has never been seen.
+        """
+        next_values = np.where(
+            (state_ids == -1) | (self._best_actions[state_ids] == -1),
+            0,
+            self._best_values[state_ids],
+        )
+        targets = rewards + self.discount_rate * next_values
+        prev_values = self._q[prev_state_ids, prev_action_ids]
+        self._q[prev_state_ids, prev_action_ids] = prev_values + self.learning_rate * (targets - prev_values)
+        self._stored[prev_state_ids, prev_action_ids] = True
+        rows = np.unique(prev_state_ids)
+        values = np.where(self._stored[rows], self._q[rows], -np.inf)
+        self._best_actions[rows] = values.argmax(axis=1)
+        self._best_values[rows] = values.max(axis=1)
 
     def get_value(self, observation, action): # noqa: D102
-        return self.value_function.get(observation, {}).get(action, 0)
+        state_id = self._state_ids.get(observation)
+        action_id = self._action_ids.get(action)
+        if state_id is None or action_id is None:
+            return 0
+        return float(self._q[state_id, action_id])
 
     def get_stored_actions(self, observation): # noqa: D102
-        if observation not in self.value_function:
+        state_id = self._state_ids.get(observation)
+        if state_id is None:
             return []
-        return self.value_function[observation].keys()
+        return [self._actions[action_id] for action_id in np.flatnonzero(self._stored[state_id])]
+
+    def get_best_stored_action(self, observation, actions=None): # noqa: D102
+        state_id = self._state_ids.get(observation)
+        if actions is not None:
+            if not actions:
+                return None
+            elif state_id is None:
+                # every action has the default value, so the first one is the best
+                return next(iter(actions))
+            # look up the state once, instead of once per action in get_value()
+            values = self._q[state_id]
+            action_ids = self._action_ids
+
+            def get_value(action):
+                action_id = action_ids.get(action)
+                if action_id is None:
+                    return 0
+                return values[action_id]
+
+            return max(actions, key=get_value)
+        if state_id is None or self._best_actions[state_id] == -1:
+            return None
+        return self._actions[self._best_actions[state_id]]
+
+    def get_best_stored_value(self, observation, actions=None): # noqa: D102
+        if actions is not None:
+            return super().get_best_stored_value(observation, actions=actions)
+        state_id = self._state_ids.get(observation)
+        if state_id is None or self._best_actions[state_id] == -1:
+            return 0
+        return float(self._best_values[state_id])
+
+    def start_new_episode(self): # noqa: D102
+        self.flush_transitions()
+        super().start_new_episode()
+
+    def observe_end_of_episode(self): # noqa: D102
+        self.flush_transitions()
+
+    def flush_transitions(self):
+        """Apply the buffered transitions of a batch episode to the value function."""
+        if not self._transitions:
+            return
+        prev_state_ids, prev_action_ids, rewards, observations = zip(*self._transitions)
+        self._transitions = []
+        # next states are looked up now, since they may have been seen later in the episode
+        prev_state_ids = np.array(prev_state_ids, dtype=np.int64)
+        prev_action_ids = np.array(prev_action_ids, dtype=np.int64)
+        rewards = np.array(rewards, dtype=np.float64)
+        state_ids = np.array([self._state_ids.get(observation, -1) for observation in observations], dtype=np.int64)
+        for _ in range(self.replay_epochs):
+            self.batch_observe_reward(prev_state_ids, prev_action_ids, rewards, state_ids)
 
     def observe_reward(self, observation, reward, actions=None): # noqa: D102
         if self.prev_observation is None or self.prev_action is None:
             return
-        prev_value = self.get_value(self.prev_observation, self.prev_action)
-        next_value = reward + self.discount_rate * self.get_best_stored_value(observation)
-        new_value = (1 - self.learning_rate) * prev_value + self.learning_rate * next_value
-        self.value_function[self.prev_observation][self.prev_action] = new_value
+        state_id = self._intern_state(self.prev_observation)
+        action_id = self._intern_action(self.prev_action)
+        if self.learn_mode == 'batch':
+            self._transitions.append((state_id, action_id, reward, observation))
+            if observation is None or (actions is not None and not actions):
+                self.flush_transitions()
+            return
+        td_update(
+            self._q, self._stored, self._best_values, self._best_actions,
+            state_id, action_id, self._state_ids.get(observation, -1),
+            reward, self.learning_rate, self.discount_rate,
+        )
 
     def print_value_function(self): # noqa: D102
-        for observation, values in sorted(self.value_function.items(), key=(lambda kv: str(kv[0]))):
-            print(observation)
-            for action, value in sorted(values.items(), key=(lambda kv: kv[1]), reverse=True):
-                print('    {}: {:.3f}'.format(action, value))
+        # states are printed in the order they were first seen
+        lines = []
+        for state_id, observation in enumerate(self._states):
+            action_ids = np.flatnonzero(self._stored[state_id])
+            # states can be interned without any values, eg. by batch training
+            if not action_ids.size:
+                continue
+            lines.append(str(observation))
+            values = self._q[state_id, action_ids]
+            for index in np.argsort(-values, kind='stable'):
+                lines.append('    {}: {:.3f}'.format(self._actions[action_ids[index]], values[index]))
+        if lines:
+            print('\n'.join(lines))
 
     def print_policy(self):
         """Print the policy."""
-        for observation in sorted(self.value_function.keys(), key=str):
-            print(observation)
-            best_action = self.get_best_stored_action(observation)
-            print('    {}: {:.3f}'.format(best_action, self.get_value(observation, best_action)))
+        lines = []
+        for state_id, observation in enumerate(self._states):
+            best_action = self._best_actions[state_id]
+            if best_action == -1:
+                continue
+            lines.append(str(observation))
+            lines.append('    {}: {:.3f}'.format(self._actions[best_action], self._best_values[state_id]))
+        if lines:
+            print('\n'.join(lines))
 
 
 class LinearQLearner(Agent):
@@ -196,19 +528,21 @@ class LinearQLearner(Agent):
         self.learning_rate = learning_rate
         self.discount_rate = discount_rate
         self.feature_extractor = feature_extractor
-        self.weights = defaultdict(lambda: defaultdict(float))
+        # weights are keyed by (action, feature), so each access is a single lookup
+        self.weights = defaultdict(float)
+        self.weighted_actions = {}
 
     def get_value(self, observation, action): # noqa: D102
-        if action not in self.weights:
+        if action not in self.weighted_actions:
             return 0
-        weights = self.weights[action]
+        weights = self.weights
         return sum(
-            weights[feature] * value for feature, value
+            weights.get((action, feature), 0) * value for feature, value
             in self.feature_extractor(observation, action=action).items()
         )
 
     def get_stored_actions(self, observation): # noqa: D102
-        return self.weights.keys()
+        return self.weighted_actions.keys()
 
     def observe_reward(self, observation, reward, actions=None): # noqa: D102
         if self.prev_observation is None or self.prev_action is None:
@@ -217,17 +551,21 @@ class LinearQLearner(Agent):
         next_value = reward + self.discount_rate * self.get_best_stored_value(observation, actions=actions)
         diff = next_value - prev_value
         features = self.feature_extractor(self.prev_observation, action=self.prev_action)
+        self.weighted_actions.setdefault(self.prev_action, None)
         for feature, value in features.items():
-            weight = self.weights[self.prev_action][feature]
-            self.weights[self.prev_action][feature] = weight + (self.learning_rate * diff) * value
-            if self.weights[self.prev_action][feature] == 0:
-                del self.weights[self.prev_action][feature]
+            key = (self.prev_action, feature)
+            weight = self.weights[key] + (self.learning_rate * diff) * value
+            if weight == 0:
+                del self.weights[key]
+            else:
+                self.weights[key] = weight
 
     def print_value_function(self): # noqa: D102
-        for action, weights in self.weights.items():
+        for action in self.weighted_actions:
             print(action)
-            for feature, weight in weights.items():
-                print('   ', feature, weight)
+            for (weight_action, feature), weight in self.weights.items():
+                if weight_action == action:
+                    print('   ', feature, weight)
 
 
 def epsilon_greedy(cls):
@@ -262,8 +600,9 @@ def epsilon_greedy(cls):
 
         def act(self, observation, actions): # noqa: D102
             # pylint: disable = missing-docstring
-            if self.rng.random() < self.exploration_rate:
-                return super().force_act(observation, self.rng.choice(actions))
+            if self._random() < self.exploration_rate:
+                action = actions[int(self._random() * len(actions))]
+                return super().force_act(observation, action)
             else:
                 return super().act(observation, actions)
 
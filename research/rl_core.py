@@ -3,7 +3,11 @@
 import logging
 from statistics import mean
 
-from .rl_agents import Agent
+import numpy as np
+from numba import njit
+
+from .rl_agents import Agent, td_update
+from .rl_environments import GridWorld
 
 LOGGER = logging.getLogger(__name__)
 
@@ -40,6 +44,8 @@ def run_episodes(env, agent, num_episodes, min_return=-500, update_agent=True, n
                 agent.observe_reward(env.get_observation(), reward, actions=env.get_actions())
             episodic_return += reward
             step += 1
+        if update_agent:
+            agent.observe_end_of_episode()
         returns.append(episodic_return)
     return mean(returns)
 
@@ -125,6 +131,164 @@ def train_agent(env, agent, num_episodes, min_return=-500, new_episode_hook=None
     )
 
 
+def batch_train_agent(env, agent, num_steps):
+    """Train an agent on a batch of environments that step in lockstep.
+
+    Environments that reach the end of an episode are immediately restarted.
+
+    Arguments:
+        env (VectorizedGridWorld): The batch of environments.
+        agent (TabularQLearningAgent): The agent.
+        num_steps (int): The number of steps to run each environment for.
+    """
+    state_ids = agent.intern_states(env.states)
+    action_ids = agent.intern_actions(env.ACTIONS)
+    exploration_rate = getattr(agent, 'exploration_rate', 0)
+    env.start_new_episode()
+    observations = state_ids[env.get_observations()]
+    for _ in range(num_steps):
+        choices = agent.batch_act(
+            observations,
+            action_ids,
+            env.get_action_mask(),
+            exploration_rate=exploration_rate,
+        )
+        rewards = env.react(choices)
+        next_observations = state_ids[env.get_observations()]
+        agent.batch_observe_reward(observations, action_ids[choices], rewards, next_observations)
+        env.start_new_episode(env.end_of_episode())
+        observations = state_ids[env.get_observations()]
+
+
+def compiled_train_agent(env, agent, num_episodes, min_return=-500):
+    """Train a tabular Q-learning agent on a GridWorld with a compiled episode loop.
+
+    This is equivalent to train_agent(), but the whole loop runs inside Numba
+    without creating States or Actions. The agent is epsilon-greedy if it has
+    an exploration_rate attribute, and always learns online regardless of its
+    learn_mode.
+
+    Arguments:
+        env (GridWorld): The environment.
+        agent (TabularQLearningAgent): The agent.
+        num_episodes (int): The number of episodes to run.
+        min_return (float): A minimum threshold under which to stop an episode.
+
+    Returns:
+        float: The mean return over all episodes.
+
+    Raises:
+        TypeError: If the environment is not a plain GridWorld.
+    """
+    # subclasses and memory wrappers have states, actions, and rewards the loop does not model
+    if type(env) is not GridWorld: # pylint: disable = unidiomatic-typecheck
+        raise TypeError('compiled training requires a GridWorld, not {}'.format(type(env).__name__))
+    state_ids = agent.intern_states(env.get_cell_states())
+    action_ids = agent.intern_actions(env.ACTIONS)
+    rng_state = np.array(
+        [agent.rng.getrandbits(64) | 1, agent.rng.getrandbits(64)],
+        dtype=np.uint64,
+    )
+    returns = _run_gridworld_episodes(
+        *agent.get_table_arrays(),
+        state_ids, action_ids,
+        env.width, env.height, env.start[0], env.start[1], env.goal[0], env.goal[1],
+        agent.learning_rate, agent.discount_rate, getattr(agent, 'exploration_rate', 0),
+        num_episodes, min_return, rng_state,
+    )
+    env.start_new_episode()
+    agent.start_new_episode()
+    return mean(returns)
+
+
+@njit(cache=True)
+def _xoroshiro128plus(rng_state):
+    """Generate a uniform random float in [0, 1) with xoroshiro128+."""
+    state0 = rng_state[0]
+    state1 = rng_state[1]
+    result = state0 + state1
+    state1 ^= state0
+    rng_state[0] = ((state0 << np.uint64(24)) | (state0 >> np.uint64(40))) ^ state1 ^ (state1 << np.uint64(16))
+    rng_state[1] = (state1 << np.uint64(37)) | (state1 >> np.uint64(27))
+    return (result >> np.uint64(11)) * (1.0 / 9007199254740992.0)
+
+
+@njit(cache=True)
+def _choose_gridworld_action(q_table, state_id, action_ids, legal, exploration_rate, rng_state):
+    """Choose an epsilon-greedy action among the legal GridWorld actions.
+
+    Returns:
+        int: The chosen action, as an index into GridWorld.ACTIONS.
+    """
+    choice = -1
+    if _xoroshiro128plus(rng_state) < exploration_rate:
+        remaining = int(_xoroshiro128plus(rng_state) * legal.sum())
+        for action in range(4):
+            if legal[action]:
+                if remaining == 0:
+                    return action
+                remaining -= 1
+        return choice
+    best_value = -np.inf
+    for action in range(4):
+        if legal[action] and (choice == -1 or q_table[state_id, action_ids[action]] > best_value):
+            choice = action
+            best_value = q_table[state_id, action_ids[action]]
+    return choice
+
+
+@njit(cache=True)
+def _run_gridworld_episodes(
+        q_table, stored, best_values, best_actions,
+        state_ids, action_ids,
+        width, height, start_row, start_col, goal_row, goal_col,
+        learning_rate, discount_rate, exploration_rate,
+        num_episodes, min_return, rng_state,
+):
+    """Run epsilon-greedy tabular Q-learning episodes on a GridWorld.
+
+    Cells are numbered row * width + col, and actions are numbered in the
+    order of GridWorld.ACTIONS; state_ids and action_ids translate these into
+    the IDs of the agent's Q-table.
+
+    Returns:
+        np.ndarray: The return of each episode.
+    """
+    returns = np.zeros(num_episodes)
+    legal = np.zeros(4, dtype=np.bool_)
+    for episode in range(num_episodes):
+        row = start_row
+        col = start_col
+        episodic_return = 0.0
+        while not (row == goal_row and col == goal_col) and episodic_return > min_return:
+            legal[0] = row > 0
+            legal[1] = row < height - 1
+            legal[2] = col > 0
+            legal[3] = col < width - 1
+            state_id = state_ids[row * width + col]
+            choice = _choose_gridworld_action(q_table, state_id, action_ids, legal, exploration_rate, rng_state)
+            if choice == 0:
+                row -= 1
+            elif choice == 1:
+                row += 1
+            elif choice == 2:
+                col -= 1
+            else:
+                col += 1
+            if row == goal_row and col == goal_col:
+                reward = 1.0
+            else:
+                reward = -1.0
+            td_update(
+                q_table, stored, best_values, best_actions,
+                state_id, action_ids[choice], state_ids[row * width + col], reward,
+                learning_rate, discount_rate,
+            )
+            episodic_return += reward
+        returns[episode] = episodic_return
+    return returns
+
+
 def train_and_evaluate(env, agent, num_episodes, **kwargs):
     """Train an agent and evaluate it at regular intervals.
 
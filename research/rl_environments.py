@@ -1,5 +1,7 @@
 """Reinforcement learning environments."""
 
+import numpy as np
+
 from .randommixin import RandomMixin
 from .data_structures import TreeMultiMap
 
@@ -34,8 +36,10 @@ class Environment:
     def get_actions(self):
         """Get the available actions.
 
+        The result should not be modified, since it may be shared.
+
         Returns:
-            [Action]: A list of available actions.
+            Sequence[Action]: The available actions.
         """
         raise NotImplementedError()
 
@@ -45,7 +49,7 @@ class Environment:
         Returns:
             bool: True if the episode has ended.
         """
-        return self.get_actions() == []
+        return not self.get_actions()
 
     def reset(self):
         """Reset the environment entirely.
@@ -88,6 +92,8 @@ class Environment:
 class Action(TreeMultiMap):
     """An action in a reinforcement learning environment."""
 
+    __slots__ = ('name',)
+
     def __init__(self, name, **kwargs):
         """Initialize an Action object.
 
@@ -99,7 +105,9 @@ class Action(TreeMultiMap):
         self.name = name
 
     def __hash__(self):
-        return hash(tuple([self.name, *self]))
+        if self._hash is None:
+            self._hash = hash((self.name, *self.items()))
+        return self._hash
 
     def __lt__(self, other):
         if self.name < other.name:
@@ -125,6 +133,8 @@ class Action(TreeMultiMap):
 class State(TreeMultiMap):
     """A state or observation in a reinforcement learning environment."""
 
+    __slots__ = ()
+
     def __init__(self, **kwargs):
         """Initialize a State object.
 
@@ -133,10 +143,17 @@ class State(TreeMultiMap):
         """
         super().__init__(multi_level=TreeMultiMap.UNIQUE_KEY, **kwargs)
 
+    def __str__(self):
+        return 'State({})'.format(
+            ', '.join('{}={}'.format(k, v) for k, v in self.items()),
+        )
+
 
 class GridWorld(Environment):
     """A simple, obstacle-free GridWorld environment."""
 
+    ACTIONS = (Action('up'), Action('down'), Action('left'), Action('right'))
+
     def __init__(self, width, height, start, goal, *args, **kwargs):
         """Initialize a GridWorld.
 
@@ -155,23 +172,52 @@ class GridWorld(Environment):
         self.goal = list(goal)
         self.row = start[0]
         self.col = start[1]
+        self._state_cache = {}
+        self._action_cache = {}
 
     def get_state(self): # noqa: D102
-        return State(row=self.row, col=self.col)
+        return self._get_cell_state(self.row, self.col)
+
+    def _get_cell_state(self, row, col):
+        # reuse the same State for each cell, so its hash is only computed once
+        state = self._state_cache.get((row, col))
+        if state is None:
+            state = self._state_cache.setdefault((row, col), State(row=row, col=col))
+        return state
+
+    def get_cell_states(self):
+        """Get the State of every cell.
+
+        Returns:
+            List[State]: The State of each cell, in row-major order.
+        """
+        return [
+            self._get_cell_state(row, col)
+            for row in range(self.height) for col in range(self.width)
+        ]
 
     def get_actions(self): # noqa: D102
+        # the available actions only depend on the position, so cache them
+        position = (self.row, self.col)
+        actions = self._action_cache.get(position)
+        if actions is None:
+            actions = self._action_cache.setdefault(position, self._generate_actions())
+        return actions
+
+    def _generate_actions(self):
         if [self.row, self.col] == self.goal:
-            return []
+            return ()
+        up_action, down_action, left_action, right_action = self.ACTIONS
         actions = []
         if self.row > 0:
-            actions.append(Action('up'))
+            actions.append(up_action)
         if self.row < self.height - 1:
-            actions.append(Action('down'))
+            actions.append(down_action)
         if self.col > 0:
-            actions.append(Action('left'))
+            actions.append(left_action)
         if self.col < self.width - 1:
-            actions.append(Action('right'))
-        return actions
+            actions.append(right_action)
+        return tuple(actions)
 
     def reset(self): # noqa: D102
         self.start_new_episode()
@@ -199,11 +245,110 @@ class GridWorld(Environment):
         raise NotImplementedError
 
 
+class VectorizedGridWorld:
+    """A batch of independent GridWorlds that step in lockstep.
+
+    Unlike the other environments, this class does not use State and Action
+    objects while stepping. Observations are integer cell IDs (row * width +
+    col) that index into the `states` list, and actions are integer indices
+    into the ACTIONS tuple. This allows an agent to act and learn on all
+    environments with a handful of NumPy operations per step.
+    """
+
+    ACTIONS = GridWorld.ACTIONS
+    UP, DOWN, LEFT, RIGHT = range(4)
+
+    def __init__(self, num_envs, width, height, start, goal):
+        """Initialize a VectorizedGridWorld.
+
+        Arguments:
+            num_envs (int): The number of GridWorlds.
+            width (int): The width of the grid.
+            height (int): The height of the grid.
+            start (Tuple[int, int]): The starting location. Origin is top left.
+            goal (Tuple[int, int]): The goal location. Origin is top left.
+        """
+        self.num_envs = num_envs
+        self.width = width
+        self.height = height
+        self.start = list(start)
+        self.goal = list(goal)
+        self.states = [
+            State(row=row, col=col)
+            for row in range(height) for col in range(width)
+        ]
+        self.rows = np.full(num_envs, self.start[0], dtype=np.int32)
+        self.cols = np.full(num_envs, self.start[1], dtype=np.int32)
+
+    def get_observations(self):
+        """Get the current observation of each GridWorld.
+
+        Returns:
+            np.ndarray: The cell ID of each GridWorld, as indices into states.
+        """
+        return self.rows * self.width + self.cols
+
+    def get_action_mask(self):
+        """Get the available actions of each GridWorld.
+
+        Returns:
+            np.ndarray: A (num_envs, len(ACTIONS)) boolean array.
+        """
+        mask = np.stack([
+            self.rows > 0,
+            self.rows < self.height - 1,
+            self.cols > 0,
+            self.cols < self.width - 1,
+        ], axis=1)
+        mask[self.end_of_episode()] = False
+        return mask
+
+    def end_of_episode(self):
+        """Determine which GridWorlds have ended their episode.
+
+        Returns:
+            np.ndarray: A boolean array, True where the episode has ended.
+        """
+        return (self.rows == self.goal[0]) & (self.cols == self.goal[1])
+
+    def reset(self):
+        """Reset all GridWorlds entirely."""
+        self.start_new_episode()
+
+    def start_new_episode(self, which=None):
+        """Reset some or all GridWorlds for a new episode.
+
+        Arguments:
+            which (np.ndarray): A boolean array of the GridWorlds to reset.
+                Defaults to resetting all of them.
+        """
+        if which is None:
+            which = slice(None)
+        self.rows[which] = self.start[0]
+        self.cols[which] = self.start[1]
+
+    def react(self, actions):
+        """Update all GridWorlds to the agent actions.
+
+        Arguments:
+            actions (np.ndarray): The index into ACTIONS for each GridWorld.
+
+        Returns:
+            np.ndarray: The reward for each GridWorld.
+        """
+        self.rows = np.where(actions == self.UP, np.maximum(0, self.rows - 1), self.rows)
+        self.rows = np.where(actions == self.DOWN, np.minimum(self.height - 1, self.rows + 1), self.rows)
+        self.cols = np.where(actions == self.LEFT, np.maximum(0, self.cols - 1), self.cols)
+        self.cols = np.where(actions == self.RIGHT, np.minimum(self.width - 1, self.cols + 1), self.cols)
+        return np.where(self.end_of_episode(), 1, -1)
+
+
 def augment_state(state, memories, prefix):
     """Add memory items to states and observations.
 
-    Note that we need to remove existing 'memory_' attributes because
-    super().get_state() could call the overridden get_observation().
+    Note that existing 'memory_' attributes are overwritten, because
+    super().get_state() could call the overridden get_observation(). The
+    given state is not modified, since it may be shared.
 
     Arguments:
         state (State): The state to augment.
@@ -213,11 +358,9 @@ def augment_state(state, memories, prefix):
     Returns:
         State: The state with memory items.
     """
-    for key in list(state.keys()):
-        if key.startswith(prefix):
-            del state[key]
-    memories = {(prefix + '{}'.format(i)): value for i, value in enumerate(memories)}
-    return State(**memories, **state)
+    attrs = dict(state.items())
+    attrs.update(((prefix + str(i)), value) for i, value in enumerate(memories))
+    return State(**attrs)
 
 
 def gating_memory(cls):
@@ -260,6 +403,8 @@ def gating_memory(cls):
             super().__init__(*args, **kwargs)
             self.reward = reward
             self.memories = num_memory_slots * [None]
+            self._gate_actions = {}
+            self._observation_cache = {}
 
         def get_state(self):
             state = super().get_state()
@@ -271,21 +416,32 @@ def gating_memory(cls):
             observation = super().get_observation()
             if observation is None:
                 return None
-            return augment_state(observation, self.memories, self.ATTR_PREFIX)
+            # reuse the augmented observation, so repeated visits return the same object
+            key = (observation, tuple(self.memories))
+            augmented = self._observation_cache.get(key)
+            if augmented is None:
+                augmented = augment_state(observation, self.memories, self.ATTR_PREFIX)
+                self._observation_cache[key] = augmented
+            return augmented
 
         def get_actions(self):
-            actions = super().get_actions()
-            if actions == []:
+            actions = tuple(super().get_actions())
+            if not actions:
                 return actions
             observations = super().get_observation()
             if observations is None:
                 return actions
-            for slot_num in range(len(self.memories)):
-                for attr in observations:
-                    if attr.startswith(self.ATTR_PREFIX):
-                        continue
-                    actions.append(Action('gate', slot=slot_num, attribute=attr))
-            return actions
+            # the gate actions only depend on the attributes, so cache them
+            attrs = tuple(attr for attr in observations if not attr.startswith(self.ATTR_PREFIX))
+            gate_actions = self._gate_actions.get(attrs)
+            if gate_actions is None:
+                gate_actions = tuple(
+                    Action('gate', slot=slot_num, attribute=attr)
+                    for slot_num in range(len(self.memories))
+                    for attr in attrs
+                )
+                self._gate_actions[attrs] = gate_actions
+            return actions + gate_actions
 
         def reset(self):
             super().reset()
@@ -339,6 +495,7 @@ def fixed_long_term_memory(cls):
             self.reward = reward
             self.wm = num_wm_slots * [None] # pylint: disable = invalid-name
             self.ltm = num_ltm_slots * [None]
+            self._memory_actions = {}
 
         def get_state(self):
             state = super().get_state()
@@ -355,21 +512,27 @@ def fixed_long_term_memory(cls):
             return augment_state(observation, self.wm, self.WM_PREFIX)
 
         def get_actions(self):
-            actions = super().get_actions()
-            if actions == []:
+            actions = tuple(super().get_actions())
+            if not actions:
                 return actions
             observations = super().get_observation()
             if observations is None:
                 return actions
-            for slot_num in range(len(self.ltm)):
-                for attr in observations:
-                    if attr.startswith(self.WM_PREFIX):
-                        continue
-                    actions.append(Action('store', slot=slot_num, attribute=attr))
-            for wm_slot_num in range(len(self.wm)):
-                for ltm_slot_num in range(len(self.ltm)):
-                    actions.append(Action('retrieve', wm_slot=wm_slot_num, ltm_slot=ltm_slot_num))
-            return actions
+            # the memory actions only depend on the attributes, so cache them
+            attrs = tuple(attr for attr in observations if not attr.startswith(self.WM_PREFIX))
+            memory_actions = self._memory_actions.get(attrs)
+            if memory_actions is None:
+                memory_actions = tuple(
+                    Action('store', slot=slot_num, attribute=attr)
+                    for slot_num in range(len(self.ltm))
+                    for attr in attrs
+                ) + tuple(
+                    Action('retrieve', wm_slot=wm_slot_num, ltm_slot=ltm_slot_num)
+                    for wm_slot_num in range(len(self.wm))
+                    for ltm_slot_num in range(len(self.ltm))
+                )
+                self._memory_actions[attrs] = memory_actions
+            return actions + memory_actions
 
         def reset(self):
             super().reset()
@@ -397,6 +560,9 @@ def fixed_long_term_memory(cls):
 class SimpleTMaze(Environment, RandomMixin):
     """A T-maze environment, with hints on which direction to go."""
 
+    HALLWAY_ACTIONS = (Action('up'),)
+    CHOICE_ACTIONS = (Action('left'), Action('right'))
+
     def __init__(self, length, hint_pos, goal_x=0, *args, **kwargs):
         """Initialize the TMaze.
 
@@ -417,25 +583,35 @@ class SimpleTMaze(Environment, RandomMixin):
         self.y = 0
         self.init_goal_x = goal_x
         self.goal_x = 0 # dummy value
+        # the symbol at each y, which is the goal at the hint and 0 elsewhere
+        self._symbols = (self.length + 1) * [0]
+        # reuse the same State for each position, so its hash is only computed once
+        self._state_cache = {}
+        self._observation_cache = {}
 
     def get_state(self): # noqa: D102
-        observation = self.get_observation()
-        return State(goal_x=self.goal_x, **observation)
+        key = (self.x, self.y, self._symbols[self.y], self.goal_x)
+        state = self._state_cache.get(key)
+        if state is None:
+            x, y, symbol, goal_x = key
+            state = self._state_cache.setdefault(key, State(x=x, y=y, symbol=symbol, goal_x=goal_x))
+        return state
 
     def get_observation(self): # noqa: D102
-        if self.y == self.hint_pos:
-            return State(x=self.x, y=self.y, symbol=self.goal_x)
-        return State(x=self.x, y=self.y, symbol=0)
+        key = (self.x, self.y, self._symbols[self.y])
+        observation = self._observation_cache.get(key)
+        if observation is None:
+            x, y, symbol = key
+            observation = self._observation_cache.setdefault(key, State(x=x, y=y, symbol=symbol))
+        return observation
 
     def get_actions(self): # noqa: D102
-        actions = []
         if self.x == 0:
             if self.y < self.length:
-                actions.append(Action('up'))
+                return self.HALLWAY_ACTIONS
             elif self.y == self.length:
-                actions.append(Action('left'))
-                actions.append(Action('right'))
-        return actions
+                return self.CHOICE_ACTIONS
+        return ()
 
     def reset(self): # noqa: D102
         self.start_new_episode()
@@ -447,6 +623,8 @@ class SimpleTMaze(Environment, RandomMixin):
             self.goal_x = self.rng.choice([-1, 1])
         else:
             self.goal_x = self.init_goal_x
+        self._symbols = (self.length + 1) * [0]
+        self._symbols[self.hint_pos] = self.goal_x
 
     def react(self, action): # noqa: D102
         assert action in self.get_actions()
@@ -77,6 +77,9 @@ def memory_architecture(cls):
             # variables
             self.buffers = {}
             self.internal_action_count = 0
+            # cache
+            self._internal_actions = None
+            self._actions_cache = (None, None)
             # initialization
             self._clear_buffers()
             super().__init__(*args, **kwargs)
@@ -110,6 +113,7 @@ def memory_architecture(cls):
             self._clear_buffers()
 
         def _clear_buffers(self):
+            self._internal_actions = None
             self.buffers = {}
             for buf, _ in self.BUFFERS.items():
                 if buf in self.buf_ignore:
@@ -126,13 +130,26 @@ def memory_architecture(cls):
             self._clear_buffers()
             self._sync_input_buffers()
             self.internal_action_count = 0
+            self._internal_actions = None
 
         def get_actions(self): # noqa: D102
             # pylint: disable = missing-docstring
-            actions = super().get_actions()
-            if actions == []:
+            actions = tuple(super().get_actions())
+            if not actions:
                 return actions
-            actions = set(actions)
+            # the internal actions only change when buffers or LTM change,
+            # so only regenerate them (and the sorted union) when necessary
+            if self._internal_actions is None:
+                self._internal_actions = self._generate_internal_actions()
+                self._actions_cache = (None, None)
+            external_actions, all_actions = self._actions_cache
+            if actions != external_actions:
+                all_actions = tuple(sorted(set(actions) | self._internal_actions))
+                self._actions_cache = (actions, all_actions)
+            return all_actions
+
+        def _generate_internal_actions(self):
+            actions = set()
             allow_internal_actions = (
                 self.max_internal_actions is None
                 or self.internal_action_count < self.max_internal_actions
@@ -142,7 +159,7 @@ def memory_architecture(cls):
                 actions.update(self._generate_delete_actions())
                 actions.update(self._generate_retrieve_actions())
                 actions.update(self._generate_cursor_actions())
-            return sorted(actions)
+            return frozenset(actions)
 
         def _generate_copy_actions(self):
             actions = []
@@ -213,6 +230,7 @@ def memory_architecture(cls):
                 reward = self.internal_reward
                 self.internal_action_count += 1
             self._sync_input_buffers()
+            self._internal_actions = None
             return reward
 
         def _process_internal_actions(self, action):
@@ -269,6 +287,7 @@ def memory_architecture(cls):
                 **kwargs: The key-value pairs of the memory element.
             """
             self.knowledge_store.store(**kwargs)
+            self._internal_actions = None
 
     return MemoryArchitectureMetaEnvironment
 
@@ -5,23 +5,38 @@ from os.path import splitext, exists as file_exists
 import gensim
 
 
-def load_model(model_path):
+def load_model(model_path, normalize=False):
     """Create a model from a binary file.
 
     Arguments:
         model_path (str): The path to the model.
+        normalize (bool): If True, replace the vectors with their unit-length
+            versions, so that cosine similarity is a dot product and only one
+            copy of the vectors is kept. Defaults to False.
 
     Returns:
-        GenSimModel: A GenSim word vector model.
+        GenSimModel: A GenSim word vector model. If it is loaded from the
+            cache, its vectors are memory-mapped read-only.
     """
-    cache_path = splitext(model_path)[0] + '.cache'
+    if normalize:
+        cache_path = splitext(model_path)[0] + '.normalized.cache'
+    else:
+        cache_path = splitext(model_path)[0] + '.cache'
     if file_exists(cache_path):
-        # use the cached version if it exists
-        model = gensim.models.KeyedVectors.load(cache_path)
+        # use the cached version if it exists, memory-mapped so that only the
+        # pages of the vectors that are actually used are read from disk
+        model = gensim.models.KeyedVectors.load(cache_path, mmap='r')
+        if normalize:
+            # the normalized vectors are saved once, so share them again
+            model.vectors_norm = model.vectors
     else:
         # otherwise, load from word2vec binary, but cache the result
         model = gensim.models.KeyedVectors.load_word2vec_format(model_path, binary=True)
-        model.init_sims()
-        # ignore=[] means ignore nothing (ie. save all pre-computations)
-        model.save(cache_path, ignore=[])
+        model.init_sims(replace=normalize)
+        if normalize:
+            # vectors_norm is the same array as vectors, which save() would write twice
+            model.save(cache_path, ignore=['vectors_norm'])
+        else:
+            # ignore=[] means ignore nothing (ie. save all pre-computations)
+            model.save(cache_path, ignore=[])
     return model
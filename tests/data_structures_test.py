@@ -77,3 +77,12 @@ def test_treemultimap():
         tmm.add(42, 42)
     with pytest.raises(ValueError):
         tmm.remove(42, 43)
+    # the cached hash must follow modifications
+    tmm = TreeMultiMap(a=1, b=2)
+    assert hash(tmm) == hash(TreeMultiMap(a=1, b=2))
+    tmm['b'] = 3
+    assert hash(tmm) == hash(TreeMultiMap(a=1, b=3))
+    del tmm['b']
+    assert hash(tmm) == hash(TreeMultiMap(a=1))
+    tmm.clear()
+    assert hash(tmm) == hash(TreeMultiMap())
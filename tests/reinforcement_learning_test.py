@@ -6,13 +6,16 @@ from collections import namedtuple
 from math import copysign
 from os.path import dirname, realpath
 
+import pytest
+
 DIRECTORY = dirname(realpath(__file__))
 sys.path.insert(0, dirname(DIRECTORY))
 
 # pylint: disable = wrong-import-position
-from research.rl_core import train_and_evaluate
+from research.rl_core import train_agent, train_and_evaluate, evaluate_agent
+from research.rl_core import batch_train_agent, compiled_train_agent
 from research.rl_environments import State, Action, Environment, RandomMixin
-from research.rl_environments import GridWorld, SimpleTMaze
+from research.rl_environments import GridWorld, SimpleTMaze, VectorizedGridWorld
 from research.rl_environments import gating_memory, fixed_long_term_memory
 from research.rl_agents import TabularQLearningAgent, LinearQLearner
 from research.rl_agents import epsilon_greedy
@@ -263,6 +266,118 @@ def test_agent():
     assert returns[-1] == -6
 
 
+def test_batch_learn_mode():
+    """Test the tabular Q-learning agent learning from whole episodes."""
+    env = GridWorld(
+        width=5,
+        height=5,
+        start=[0, 0],
+        goal=[4, 4],
+    )
+    agent = epsilon_greedy(TabularQLearningAgent)(
+        exploration_rate=0.05,
+        learning_rate=0.1,
+        discount_rate=0.9,
+        learn_mode='batch',
+        replay_epochs=2,
+        random_seed=8675309,
+    )
+    returns = list(train_and_evaluate(
+        env,
+        agent,
+        num_episodes=500,
+        eval_frequency=50,
+        eval_num_episodes=50,
+    ))
+    assert returns[-1] == -6
+    # an episode cut short by min_return should still be learned from
+    agent = TabularQLearningAgent(learning_rate=0.1, discount_rate=0.9, learn_mode='batch')
+    train_agent(env, agent, num_episodes=1, min_return=-3)
+    assert agent.get_stored_actions(State(row=0, col=0))
+
+
+def test_tabular_agent_value_table():
+    """Test the value bookkeeping of the tabular Q-learning agent."""
+    agent = TabularQLearningAgent(learning_rate=1, discount_rate=1)
+    state = State(row=0, col=0)
+    terminal = State(row=0, col=1)
+    assert agent.get_best_stored_action(state) is None
+    assert agent.get_best_stored_value(state) == 0
+    # more actions than the initial capacity of the table
+    num_actions = 2 * TabularQLearningAgent.INITIAL_CAPACITY + 1
+    for value in range(num_actions):
+        agent.force_act(state, Action(str(value)))
+        agent.observe_reward(terminal, value)
+    assert len(agent.get_stored_actions(state)) == num_actions
+    assert agent.get_best_stored_action(state) == Action(str(num_actions - 1))
+    assert agent.get_best_stored_value(state) == num_actions - 1
+    # the best action getting worse should expose the next best
+    agent.force_act(state, Action(str(num_actions - 1)))
+    agent.observe_reward(terminal, -1)
+    assert agent.get_best_stored_action(state) == Action(str(num_actions - 2))
+    assert agent.get_value(state, Action(str(num_actions - 1))) == -1
+    assert agent.get_value(terminal, Action('0')) == 0
+
+
+def test_batch_agent():
+    """Test training the tabular Q-learning agent on vectorized GridWorlds."""
+    env = VectorizedGridWorld(
+        num_envs=16,
+        width=5,
+        height=5,
+        start=[0, 0],
+        goal=[4, 4],
+    )
+    agent = epsilon_greedy(TabularQLearningAgent)(
+        exploration_rate=0.05,
+        learning_rate=0.1,
+        discount_rate=0.9,
+        random_seed=8675309,
+    )
+    batch_train_agent(env, agent, num_steps=2000)
+    # the learned policy should transfer to the object-based GridWorld
+    serial_env = GridWorld(
+        width=5,
+        height=5,
+        start=[0, 0],
+        goal=[4, 4],
+    )
+    assert evaluate_agent(serial_env, agent, num_episodes=1) == -6
+
+
+def test_compiled_gridworld_training(capsys):
+    """Test training the tabular Q-learning agent with the compiled GridWorld loop."""
+    env = GridWorld(
+        width=5,
+        height=5,
+        start=[0, 0],
+        goal=[4, 4],
+    )
+    agent = epsilon_greedy(TabularQLearningAgent)(
+        exploration_rate=0.05,
+        learning_rate=0.1,
+        discount_rate=0.9,
+        random_seed=8675309,
+    )
+    compiled_train_agent(env, agent, num_episodes=500)
+    assert evaluate_agent(env, agent, num_episodes=1) == -6
+    # the goal is interned, but has no values and should not be printed
+    agent.print_policy()
+    assert str(State(row=4, col=4)) not in capsys.readouterr().out
+    agent.print_value_function()
+    assert str(State(row=4, col=4)) not in capsys.readouterr().out
+    # wrapped GridWorlds have observations and actions the compiled loop does not model
+    memory_env = gating_memory(GridWorld)(
+        num_memory_slots=1,
+        width=5,
+        height=5,
+        start=[0, 0],
+        goal=[4, 4],
+    )
+    with pytest.raises(TypeError):
+        compiled_train_agent(memory_env, agent, num_episodes=1)
+
+
 def test_linear_agent():
     """Test the linear approximation Q-learning agent."""
 